@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import xps_plotter
+
+# Datapoint lines with one short and one long line, which together still hold four values per line on average
+ragged_text = "1\t2\t4\t6\t\n2\t3\t5\t\n3\t4\t6\t10\t99\t\n4\t1\t3\t4\t\n"
+
+
+def test_parse_datapoint_text_regular():
+    data_chunks = xps_plotter.parse_datapoint_text("1\t2\t4\t6\t\n4\t1\t3\t4\t\n", 4)
+    np.testing.assert_array_equal(data_chunks[0], [[1, 2, 4, 6], [4, 1, 3, 4]])
+
+
+def test_parse_datapoint_text_ragged():
+    assert xps_plotter.parse_datapoint_text(ragged_text, 4) is None
+
+
+def test_process_file_ragged(tmp_path, monkeypatch):
+    (tmp_path / "ragged.dat").write_text("Energy\tSweep0\tSweep1\tSum\n" + ragged_text)
+    monkeypatch.chdir(tmp_path)
+    result = xps_plotter.process_file("ragged.dat", str(tmp_path), 100.0, 1e6, False)
+    filename, xaxis, yaxis = result[:3]
+
+    # The values of each line stay on that line: the extra value of the long line is left out
+    # The short line has no sum, so it has no standard deviation and is excluded
+    assert filename == "ragged.dat"
+    np.testing.assert_array_equal(xaxis, [99, 97, 96])
+    np.testing.assert_array_equal(yaxis, [3, 5, 2])
+    assert result[4] == [2]
+
+
+def test_process_file_alternative_delimiters_in_chunks(tmp_path, monkeypatch):
+    (tmp_path / "commas.dat").write_text("Energy,Sweep0,Sweep1,Sum\n1,2,4,6,\n2;3;5;8;\n3 4 6 10 \n4,1,3,4,\n")
+    monkeypatch.chdir(tmp_path)
+    # The pandas parser is used with chunks smaller than the file
+    monkeypatch.setattr(xps_plotter, "fast_parse_bytes", 0)
+    monkeypatch.setattr(xps_plotter, "chunk_lines", 3)
+    result = xps_plotter.process_file("commas.dat", str(tmp_path), 100.0, 1e6, False)
+    xaxis, yaxis = result[1:3]
+
+    np.testing.assert_array_equal(xaxis, [99, 98, 97, 96])
+    np.testing.assert_array_equal(yaxis, [3, 4, 5, 2])
+
+
+def test_process_file_comma_space_delimiters(tmp_path, monkeypatch):
+    (tmp_path / "spaced.dat").write_text("Energy, Sweep0, Sweep1, Sum\n1, 2, 4, 6,\n2, 3, 5, 8,\n3, 2, 6, 8,\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(xps_plotter, "fast_parse_bytes", 0)
+    result = xps_plotter.process_file("spaced.dat", str(tmp_path), 100.0, 1.5**2, False)
+    std_records, excluded_point_numbers = result[3:5]
+
+    np.testing.assert_array_equal(std_records["std"], [1, 1, 2])
+    assert excluded_point_numbers == [3]
+
+
+@pytest.mark.parametrize("fast_parse_bytes", [0, 4*1024*1024])
+def test_process_file_missing_value_in_first_line(tmp_path, monkeypatch, fast_parse_bytes):
+    (tmp_path / "missing.dat").write_text("Energy\tSweep0\tSweep1\tSum\n1\t\t4\t6\t\n2\t3\t5\t8\t\n3\t4\t6\t10\t\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(xps_plotter, "fast_parse_bytes", fast_parse_bytes)
+    result = xps_plotter.process_file("missing.dat", str(tmp_path), 100.0, 1e6, False)
+    xaxis, yaxis, std_records, excluded_point_numbers = result[1:5]
+
+    # The missing sweep intensity leaves the other columns in place and only excludes its own datapoint
+    np.testing.assert_array_equal(xaxis, [98, 97])
+    np.testing.assert_array_equal(yaxis, [4, 5])
+    np.testing.assert_array_equal(std_records["std"], [np.nan, 1, 1])
+    assert excluded_point_numbers == [1]
+
+
+
+def test_process_file_same_result_from_both_parsers(tmp_path, monkeypatch):
+    # Lines with repeated tabs and a tab at the start, which pandas reads as empty fields
+    (tmp_path / "repeated.dat").write_text("Energy\tSweep0\tSweep1\tSum\n1\t2\t4\t6\t\n2\t3\t\t5\t8\t\n"
+                                           "\t3\t4\t6\t10\n4\t1\t3\t4\t\n5\t\t2\t2\t4\t\n")
+    monkeypatch.chdir(tmp_path)
+    results = []
+    for fast_parse_bytes in [4*1024*1024, 0]:
+        monkeypatch.setattr(xps_plotter, "fast_parse_bytes", fast_parse_bytes)
+        results.append(xps_plotter.process_file("repeated.dat", str(tmp_path), 100.0, 1e6, False))
+    numpy_result, pandas_result = results
+
+    np.testing.assert_array_equal(numpy_result[1], pandas_result[1])
+    np.testing.assert_array_equal(numpy_result[2], pandas_result[2])
+    for field in ["datapoint", "line", "std"]:
+        np.testing.assert_array_equal(numpy_result[3][field], pandas_result[3][field])
+    assert numpy_result[4:] == pandas_result[4:]
+
+
+@pytest.mark.parametrize("fast_parse_bytes", [0, 4*1024*1024])
+def test_process_file_alternative_delimiter_on_later_line(tmp_path, monkeypatch, fast_parse_bytes):
+    (tmp_path / "later.dat").write_text("Energy\tSweep0\tSweep1\tSum\n1\t2\t4\t6\t\n2\t3\t5\t8\t\n3\t4,6\t10\t\n4\t1\t3\t4\t\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(xps_plotter, "fast_parse_bytes", fast_parse_bytes)
+    result = xps_plotter.process_file("later.dat", str(tmp_path), 100.0, 1e6, False)
+    xaxis, yaxis = result[1:3]
+
+    np.testing.assert_array_equal(xaxis, [99, 98, 97, 96])
+    np.testing.assert_array_equal(yaxis, [3, 4, 5, 2])
+
+
+def test_process_file_unreadable(tmp_path, monkeypatch):
+    (tmp_path / "text.dat").write_text("Energy\tSweep0\tSweep1\tSum\n1\t2\t4\t6\t\n2\tx\t5\t8\t\n")
+    monkeypatch.chdir(tmp_path)
+    assert xps_plotter.process_file("text.dat", str(tmp_path), 100.0, 1e6, False) is None
@@ -1,4 +1,4 @@
-''' 
+'''
 XPS Spectra Plotter with Custom Error Datapoint Exclusion.
 
 This script allows the user to create average plots from experimental X-ray photoelectron spectroscopy (XPS) data.
@@ -12,6 +12,7 @@ This program can produce a final combined plot which combines all the surface co
 The user can choose whether they would like to produce individual plots, combined plots or both.
 A file containing the standard deviations of all datapoints for all the files in the folder will be generated.
 Files containing the excluded datapoints and included datapoints for each individual plot will be created.
+The files in the folder are processed in parallel, one file at a time per worker process.
 
 It is required that:
     * the experimental files are in .dat file format.
@@ -24,18 +25,38 @@ It is required that:
 It is required that the user installs:
     * Anaconda (version 2022.05)
     * Python (version 3.9.12)
-    * numpy (version 1.21.5) 
+    * numpy (version 1.21.5)
     * matplotlib (version 3.5.1)
+    * pandas (version 1.4.2)
 This should be done within the python environment where this script is currently being run.
 
 This file contains the following functions:
-    * standard_deviation_threshold - removes datapoints which are above the specified standard deviation from plots
+    * standard_deviation_threshold - finds the datapoints which are above the specified standard deviation so they can be removed from plots
+    * create_individual_figure - creates the figure which a worker process reuses for the individual plots
+    * calculate_point_variances - calculates the variance of the sweep intensities of every datapoint
+    * parse_datapoint_text - parses the datapoint lines of a small file without using pandas
+    * read_csv_chunks - parses a file with pandas one chunk of lines at a time
+    * read_datapoint_values - parses a file and calculates the binding energies, mean intensities and variances of its datapoints
+    * process_file - reads one .dat file, applies the standard deviation threshold and creates its individual plot
+
+This file contains the following class:
+    * DelimiterCorrectedFile - replaces the alternative delimiters of a file as it is read
 '''
 
 # General imports
 import os  # lets vscode interact with the operating system
+import warnings  # lets numpy's warning about a file it cannot parse be hidden as pandas is used instead
+from functools import partial  # lets the user inputs be fixed when the files are sent to the worker processes
+from multiprocessing import Pool  # lets the files be processed in parallel
+# The plots are only saved as .png files and never shown, so matplotlib's non-interactive Agg backend is used
+# This must be chosen before pyplot is imported and stops any GUI plotting backend from being loaded
+# Reference: https://matplotlib.org/stable/users/explain/figure/backends.html
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt  # for plot creation
+from matplotlib.figure import Figure  # for plot creation inside the worker processes
 import numpy as np  # for mathematical calulations
+import pandas as pd  # for reading the .dat files
 
 # The following imports will be used to allow the user to import files
 # This has been adapted from the following references:
@@ -53,162 +74,354 @@ import tkinter
 from tkinter.filedialog import askdirectory
 import glob
 
-# Initial message to the user explaining this program
-print("You will be prompted to select the folder which contains the .dat files you would like to make plots for.")
-print("(Note: files in subfolder will not be selected.)")
-initial_message = input("To continue, press 'y' and then enter ")
-
-# Creation of folder selection pop-up
-if initial_message == "y":
-    # If the user continues after the inital message: dialogue box appears, asks user to select folder and returns the path
-    folderpath = askdirectory(title='Select Folder')
-else:
-    # Message to the user in case they enter the wrong input
-    print("Re-run the code and make sure to just enter the letter 'y' with no spaces or apostrophes - just the letter.")
-    exit()  # Ends the execution of the program so the user will re-run it
-
-# Statement lets the user check that they imported the right folder
-print("This is the selected folderpath: " + folderpath)
-
-# Set up of x-axis and y-axis lists for the final combined plot (of all files in the selected folder)
-fp_xaxis = []
-fp_yaxis = []
-
 # Definition of variables used to read lines of code in the loop
+# These are defined outside of the main program so that the worker processes can also use them
 # A tab is the standard delimiter of experimental XPS (.dat) files
 delimit = "\t"
 numhead = 1  # Number of header-lines in the file which will not be read as data as they contain column headers
+# Error trap: common alternative delimiters that may be present are replaced with the standard delimiter
+# A translation table replaces all of them in one pass over the text
+alternative_delimiter = [",", ";", " "]
+alternative_delimiter_table = str.maketrans(dict.fromkeys(alternative_delimiter, delimit))
+chunk_lines = 65536  # Number of lines of a file which are read and processed at a time
+fast_parse_bytes = 4*1024*1024  # Files up to this size (in bytes) are read in one go without using pandas
+
+# Each record of the binary standard deviation file holds:
+# index of the file in std_filenames, datapoint number, line in the respective file, standard deviation
+std_record_dtype = [("file", "i4"), ("datapoint", "i4"), ("line", "i4"), ("std", "f8")]
+
+# Settings which speed up the drawing of plots with tens of thousands of points
+# Reference: https://matplotlib.org/stable/users/explain/artists/performance.html
+plt.rcParams["path.simplify"] = True
+plt.rcParams["path.simplify_threshold"] = 1.0
+plt.rcParams["agg.path.chunksize"] = 10000
+
+# Plots are drawn with plot() dot markers rather than scatter() as this is much faster for many identical points
+# plot() sets the marker diameter whereas scatter() sets its area, so this matches the scatter() marker size of 0.5
+marker_size = np.sqrt(0.5)
+
+# Figure and axes which every worker process reuses for the individual plots of all the files it is given
+individual_figure = None
+individual_axes = None
+
+# Defining functions and classes
+
+def create_individual_figure():
+    '''
+    This function creates the figure and axes used for the individual plots when a worker process starts.
 
-# Section divider printed in terminal for clarity 
-print("----------------------------------------------------------------------")
+    Parameters
+    ----------
+    individual_figure : matplotlib.figure.Figure
+        Figure reused for the individual plots
+    individual_axes : matplotlib.axes.Axes
+        Axes reused for the individual plots
 
-# The user inputs the photon energy at which the scan was run
-print("Photon energy must be an integer or float.")
-photon_energy = input("Enter photon energy in eV. ")
+    Returns
+    ----------
+    The function does not return a value but, instead, sets the individual figure and axes of the worker process
+    '''
+    global individual_figure, individual_axes
+    # The figure is created without pyplot so that no figure windows are opened by the worker processes
+    individual_figure = Figure()
+    individual_axes = individual_figure.subplots()
 
-# Section divider printed in terminal for clarity 
-print("----------------------------------------------------------------------")
 
-# The user chooses the threshold standard deviation
-print("What standard deviation would you like to specify?")
-std_input = input("Just enter the number without any units. It must be positive. ")
+def standard_deviation_threshold(point_variances, std_threshold_squared):
+    '''
+    This function finds the datapoints with standard deviations above the user-chosen one so they can be removed from the plots.
 
-# Error trap
-# Creation of an error message if a number is not entered for photon energy or standard deviation value
-# Creation of an error message if the number entered is negative
-user_input_numbers = [photon_energy, std_input]
-for entered_value in user_input_numbers:
-    try: 
-        entered_value = float(entered_value) # Ensuring that the input is a number
-        if entered_value >= 0: # Ensuring the number is positive or zero
-            pass
-        else:
-            print("The number you entered for photon energy or standard deviation is negative.")
-            print("Re-run the program and try again.")
-            exit()
-    except ValueError: 
-        print ("You did not enter a number for either photon energy or standard deviation.") 
-        print("Re-run the program and try again.")
-        exit()
-
-
-# Section divider printed in terminal for clarity 
-print("----------------------------------------------------------------------")
-
-# The user chooses what kind of output they want
-print("You can choose the type of output plots produced.")
-print("If you would like to produce only individual plots for each file, enter 'i'.")
-print("If you would like to produce only the final combined plot which uses all files in the folder, enter 'f'.")
-output_plot_choice = input("If you would like to produce both, enter 'b'.")
-if output_plot_choice == "i" or output_plot_choice == "b" or output_plot_choice == "f":
-    pass
-elif output_plot_choice == "I" or output_plot_choice == "B" or output_plot_choice == "F":
-    pass
-else:
-    print("You did not enter an appropriate letter when choosing output plot types.")
-    print("Re-run the program and try again.")
-    exit()  # Ends the execution of the program so the user will re-run it
-
-# Section divider printed in terminal for clarity 
-print("----------------------------------------------------------------------")
-
-# Standard deviation, excluded datapoint and included datapoint files which are produced must be reset at the start of every run
-# This is in case the the user tries to run the program twice without deleting the files produced by the first run
-# This prevents the program from appending the information from the second run onto that of the first
-output_file = ["std_file.txt", "excluded_datapoints_file.txt",
-                "included_datapoints_file.txt"]
-for txt_file in output_file:
-    if os.path.exists(txt_file):  # Existance of the files from previous runs is checked
-        os.remove(txt_file)  # Old files are deleted
-    else:
-        pass
+    Parameters
+    ----------
+    point_variances : numpy.ndarray
+        Variances (squared standard deviations) of all datapoints in the file
+    std_threshold_squared : float
+        Square of the standard deviation value chosen by the user
+
+    Returns
+    ----------
+    keep_mask : numpy.ndarray
+        Boolean array which is True for the included datapoints and False for the excluded datapoints
+    '''
+    # Datapoints at or below the threshold are included, all the others are excluded
+    # Datapoints without a standard deviation (nan, from a missing value) are therefore excluded as well
+    # The whole file is compared at once so no values need to be removed from the plot lists
+    # Standard deviations and the threshold are never negative, so comparing their squares gives the same result
+    # This means no square root has to be taken to decide whether a datapoint is excluded
+    keep_mask = point_variances <= std_threshold_squared
+    return keep_mask
 
-# Defining a function
 
-def standard_deviation_threshold():
+def calculate_point_variances(sweep_intensities, mean_intensities, deviations_buffer=None):
     '''
-    This function removes datapoints with standard deviations above the user-chosen one from the plots.
+    This function calculates the variance of the sweep intensities of every datapoint.
 
     Parameters
     ----------
-    point_standard_deviation : float
-        Standard deviation of the datapoint
-    std_input : string
-        Standard deviation value chosen by the user
-    axes: list[list]
-        List of names of all axes
-    xaxis: list
-        x-axis values for individual file plots
-    yaxis: list
-        y-axis values for individual file plots
-    fp_xaxis: list
-        x-axis values for final combined plot
-    fp_yaxis: list
-        y-axis values for final combined plot
-    binding_energy: float
-        Binding energy of the datapoint
-    mean_intensity: float
-        Mean intensity of the datapoint
-    excluded_point_numbers: list
-        List of excluded datapoint numbers
-    datapoint_number: int
-        Datapoint number
-    included_point_numbers : list
-        List of included datapoint numbers
+    sweep_intensities : numpy.ndarray
+        2-D array of the intensities of each sweep (one row per datapoint)
+    mean_intensities : numpy.ndarray
+        Mean intensity of each datapoint
+    deviations_buffer : numpy.ndarray, optional
+        Preallocated array (with at least as many rows as sweep_intensities) which the deviations are written into
 
     Returns
     ----------
-    The function does not return a value but, instead, updates the axes list
+    point_variances : numpy.ndarray
+        Variance of the intensities of each datapoint
     '''
-    # Reference: https://www.oreilly.com/library/view/python-cookbook/0596001673/ch17s02.html
-    # This reference helped me redirect the NameError message when user selects the wrong folder
-    # try/except statements allow common errors to be redirected to a custom backup action
-    try: 
-        if point_standard_deviation > float(std_input):
-            axes = [xaxis, yaxis, fp_xaxis, fp_yaxis]
-            for xax in axes[0::2]:
-                xax.remove(binding_energy)  # Removal of x-axis values from plots
-            for yax in axes[1::2]:
-                yax.remove(mean_intensity)  # Removal of y-axis values from plots
-            # Excluded datapoint number stored in a list
-            excluded_point_numbers.append(datapoint_number)
-        else:
-            # Included datapoint number stored in a list
-            included_point_numbers.append(datapoint_number)
-    except NameError:
-        # Section divider printed in terminal for clarity 
-        print("----------------------------------------------------------------------") 
-        # Substitute for the NameError message
-        print("You selected the wrong folder. It must be the folder that this script is saved in.")
-        exit() # Ends the execution of the program so the user will re-run it
+    # Reference: introduction to python pt1 (from the CHEM0062 Moodle page)
+    # The deviations from the mean intensity are squared and summed across the sweeps of every datapoint in one step
+    # einsum multiplies and sums in a single loop so no extra array of squared deviations has to be created
+    # Reference: https://numpy.org/doc/stable/reference/generated/numpy.einsum.html
+    # The deviations are written into the preallocated buffer (if given) rather than into a new array every time
+    if deviations_buffer is not None:
+        deviations_buffer = deviations_buffer[:len(sweep_intensities)]
+    deviations = np.subtract(sweep_intensities, mean_intensities[:, np.newaxis], out=deviations_buffer)
+    point_variances = np.einsum("ij,ij->i", deviations, deviations)/deviations.shape[1]
+    return point_variances
+
+
+def parse_datapoint_text(datapoint_text, num_columns):
+    '''
+    This function parses the datapoint lines of a file into a 2-D array of floats without using pandas.
+
+    Parameters
+    ----------
+    datapoint_text : string
+        Text of the datapoint lines of the file (without the header lines), using the standard delimiter
+    num_columns : int
+        Number of columns in each line (not counting the empty value after the tab at the end of each line)
+
+    Returns
+    ----------
+    data_chunks : list or None
+        List holding one 2-D array of all the datapoints in the file
+        None is returned if the text could not be parsed this way so that pandas can be used instead
+    '''
+    if num_columns == 0 or not datapoint_text:
+        return None
+
+    # fromstring reads every number in the text in one C loop, the tabs and line endings between them are skipped
+    # Depending on the numpy version it either warns or fails when it has to stop early
+    # In both cases pandas is used instead, so the number of values read is also checked
+    # Reference: https://numpy.org/doc/stable/reference/generated/numpy.fromstring.html
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            values = np.fromstring(datapoint_text, sep=delimit)
+    except ValueError:
+        return None
+    num_lines = datapoint_text.count("\n") + (not datapoint_text.endswith("\n"))
+    if values.size != num_lines*num_columns:
+        return None
+
+    # fromstring treats any run of whitespace as one separator, whereas pandas splits the fields on every tab
+    # (so two tabs in a row or a tab at the start of a line give an empty field, which pandas reads as a missing value)
+    # Text with empty fields or with whitespace other than tabs and line endings is left to pandas so that both parsers
+    # always give the same values
+    characters = np.frombuffer(datapoint_text.encode(), dtype=np.uint8)
+    is_separator = characters <= 32  # tabs, spaces and line endings are all at or below byte 32
+    is_tab = characters == ord("\t")
+    is_newline = characters == ord("\n")
+    is_carriage_return = characters == ord("\r")
+    if is_tab[0] or np.any(is_tab[1:] & (is_tab[:-1] | is_newline[:-1])):
+        return None
+    if np.any(is_separator & ~(is_tab | is_newline | is_carriage_return)):
+        return None
+    if is_carriage_return[-1] or np.any(is_carriage_return[:-1] & ~is_newline[1:]):
+        return None
+
+    # fromstring does not see where lines end either, so a short line followed by a long line would still give the right
+    # total number of values with the values moved onto the wrong lines
+    # The values on every line are counted: a value starts wherever a tab or line ending is followed by any other character
+    value_starts = ~is_separator
+    value_starts[1:] &= is_separator[:-1]
+    line_ends = np.flatnonzero(is_newline)
+    if not datapoint_text.endswith("\n"):
+        line_ends = np.append(line_ends, characters.size)
+    values_per_line = np.diff(np.searchsorted(np.flatnonzero(value_starts), line_ends), prepend=0)
+    if np.any(values_per_line != num_columns):
+        return None
+    return [values.reshape(num_lines, num_columns)]
+
+
+class DelimiterCorrectedFile:
+    '''
+    This class wraps an open .dat file so that its alternative delimiters are replaced with the standard delimiter as it is read.
+    Only the text which is asked for is corrected, so pandas can read a large file in chunks without a corrected copy of
+    the whole file being held in memory.
+
+    Parameters
+    ----------
+    infile : file object
+        The .dat file opened for reading
+    '''
+
+    def __init__(self, infile):
+        self.infile = infile
+
+    def read(self, size=-1):
+        return self.infile.read(size).translate(alternative_delimiter_table)
+
+    def readline(self):
+        return self.infile.readline().translate(alternative_delimiter_table)
+
+    def seek(self, offset):
+        return self.infile.seek(offset)
+
+    # pandas only accepts objects which can be iterated over (line by line) as files
+    # Reference: https://pandas.pydata.org/docs/reference/api/pandas.api.types.is_file_like.html
+    def __iter__(self):
+        return (line.translate(alternative_delimiter_table) for line in self.infile)
 
 
-# Creation of the major loop which gets the filepaths for all the files in the selected folder
-# glob is used to return files ending with '.dat'
-for count, filename in enumerate(glob.glob("*.dat")):
+def read_csv_chunks(data_source, num_fields):
+    '''
+    This function parses a file into 2-D arrays of floats with pandas, one chunk of lines at a time.
+
+    Parameters
+    ----------
+    data_source : file object
+        The .dat file (or the file with its delimiters corrected) at its start
+    num_fields : int
+        Number of fields in the first datapoint line (not counting the empty field after the tab at the end of the line)
+
+    Returns
+    ----------
+    data_chunks : generator
+        2-D array of the datapoints in each chunk of lines, without the columns which hold no values
+        A ValueError is raised if pandas could not parse the file
+    '''
+    # The document is parsed into 2-D arrays of floats by pandas' C parser
+    # The header lines are skipped and only the fields found in the first datapoint line are read
+    # Very large files are read in chunks of lines so only one chunk of sweep intensities is held in memory at a time
+    # Reference: https://pandas.pydata.org/docs/reference/api/pandas.read_csv.html
+    data_columns = None
+    for chunk in pd.read_csv(data_source, sep=delimit, skiprows=numhead, header=None, usecols=range(num_fields),
+                             engine="c", chunksize=chunk_lines):
+        data = chunk.to_numpy(dtype=np.float64)
+
+        # Columns without any values are dropped, as these are created where two delimiters follow each other
+        # (such as the comma and space of ", " once both are replaced with tabs)
+        # Empty values in the other columns are missing values and are kept so that the columns stay in place
+        # The columns are found from the first chunk, a later chunk with values in one of them cannot be read this way
+        if data_columns is None:
+            empty_columns = np.isnan(data).all(axis=0)
+            data_columns = np.flatnonzero(~empty_columns)
+        if np.any(empty_columns):
+            if not np.isnan(data[:, empty_columns]).all():
+                raise ValueError("A column which is empty at the start of the file has values further on")
+            data = data[:, data_columns]
+        yield data
+
+
+def read_datapoint_values(data_source, use_numpy, photon_energy, num_fields):
+    '''
+    This function parses the datapoints of a file and calculates their binding energies, mean intensities and variances.
+
+    Parameters
+    ----------
+    data_source : file object
+        The .dat file (or the file with its delimiters corrected) to be parsed from its start
+    use_numpy : bool
+        Whether the whole file is parsed in one go by NumPy rather than in chunks by pandas
+    photon_energy : float
+        Photon energy at which the scan was run in eV
+    num_fields : int
+        Number of fields in the first datapoint line (not counting the empty field after the tab at the end of the line)
+
+    Returns
+    ----------
+    file_values : tuple or None
+        (binding_energies, mean_intensities, point_variances) for all datapoints in the file
+        None is returned if NumPy could not parse the file
+        A ValueError is raised if pandas could not parse the file
+    '''
+    data_source.seek(0)
+
+    # Small files are parsed in one go by NumPy's C number parser as this has much less overhead than pandas
+    # The header lines are skipped first
+    if use_numpy:
+        for x in range(numhead):
+            data_source.readline()
+        data_chunks = parse_datapoint_text(data_source.read(), num_fields)
+        if data_chunks is None:
+            return None
+
+    # Otherwise the file is parsed by pandas in chunks of lines
+    # Each datapoint only depends on its own line, so the chunks can be processed separately and joined at the end
+    else:
+        data_chunks = read_csv_chunks(data_source, num_fields)
+
+    binding_energy_chunks = []
+    mean_intensity_chunks = []
+    point_variance_chunks = []
+    deviations_buffer = None
+    for data in data_chunks:
+
+        # The column layout is found from the first chunk, every line of a file has the same columns
+        if deviations_buffer is None:
+            # Setting a variable for the index of the last column
+            intensity_sum_index = data.shape[1] - 1
+            num_sweeps = intensity_sum_index - 1
+
+            # Finding the columns of the intensities of each sweep (excluding the energy and intensity sum values)
+            if num_sweeps > 0:
+                # Average intensity of all sweeps
+                sweep_columns = slice(1, intensity_sum_index)
+                mean_divisor = num_sweeps
+            else:
+                # To account for files with only 1 sweep which have no sum column
+                sweep_columns = slice(1, intensity_sum_index+1)
+                mean_divisor = 1
+
+        # Binding energies of all datapoints (the first column is kinetic energy)
+        binding_energy_chunks.append(photon_energy - data[:, 0])
+
+        # Finding the mean intensities and the intensities of each sweep
+        mean_intensities = data[:, intensity_sum_index]/(mean_divisor)
+        sweep_intensities = data[:, sweep_columns]
+        mean_intensity_chunks.append(mean_intensities)
+
+        # Calculation of the variance of the intensities for each datapoint
+        # The buffer for the deviations is allocated once per file (the first chunk is the largest) and reused
+        if deviations_buffer is None:
+            deviations_buffer = np.empty(sweep_intensities.shape)
+        point_variance_chunks.append(calculate_point_variances(sweep_intensities, mean_intensities, deviations_buffer))
+
+    # Joining the chunks into the values of all datapoints in the file
+    return (np.concatenate(binding_energy_chunks), np.concatenate(mean_intensity_chunks),
+            np.concatenate(point_variance_chunks))
+
+
+def process_file(filename, folderpath, photon_energy, std_threshold_squared, do_individual):
+    '''
+    This function reads one .dat file, excludes its datapoints above the threshold and creates its individual plot.
+    It is run by a worker process so that several files can be processed at the same time.
+
+    Parameters
+    ----------
+    filename : string
+        Name of the .dat file
+    folderpath : string
+        Path of the folder selected by the user
+    photon_energy : float
+        Photon energy at which the scan was run in eV
+    std_threshold_squared : float
+        Square of the standard deviation value chosen by the user
+    do_individual : bool
+        Whether the individual plot for the file is saved
+
+    Returns
+    ----------
+    result : tuple or None
+        (filename, xaxis, yaxis, std_records, excluded_point_numbers, included_point_numbers) for the file
+        None is returned if the file could not be read from the selected folder or its datapoints could not be parsed
+    '''
     with open(os.path.join(os.getcwd(), filename), 'r') as f:
         # Message to the user so they know the program is running
-        if output_plot_choice != "f" and output_plot_choice != "F":
+        if do_individual:
             print("The plot for " + filename + " is currently being created.")
         else: print("Loading...") # If only the final combined plot output is chosen.
     filepath = os.path.join(folderpath, filename)
@@ -217,150 +430,297 @@ for count, filename in enumerate(glob.glob("*.dat")):
     # Creation of an average xps plot for all .dat files in the folder
     # Individual plots for each .dat file will be plotted as well as a plot which combines all the individual plots
     # Plots will exclude datapoints - exclusion is based on the threshold set by the user
-    if os.path.exists(filepath):
-        with open(filepath, 'r') as infile:
-            # Definition of list variables
-            xaxis = []
-            yaxis = []
-            standard_deviations_list = []
-            excluded_point_numbers = []
-            included_point_numbers = []
-            intensities_in_a_line_list = []
-
-            # The document is read line-by-line
-            for x in range(numhead+1):
-                line = infile.readline()
-            line_number = 1  # Setting up the line counter
-            while line:
-                # Saving the current line number
-                line_number += 1
-
-                # Save current datapoint number
-                datapoint_number = (line_number - 1)
-
-                # Creating a list containing all the values in a line
-                # Error trap: common alternative delimiters that may be present are replaced with the standard delimiter
-                alternative_delimiter = [",", ";", " "]
-                for alternate in alternative_delimiter:
-                    line = line.replace(alternate, delimit)
-                datapoint = line.split(delimit)
-
-                # Appending energies to the x-axis
-                kinetic_energy = float(datapoint[0])
-                binding_energy = float(photon_energy) - kinetic_energy
-                xaxis.append(binding_energy)
-                fp_xaxis.append(binding_energy)
-
-                # Setting a variable for the index of the last column
-                # '-2' on the first line is because we want the index and there is a tab at the end of each line that needs to be excluded
-                intensity_sum_index = (int(len(datapoint)) - 2)
-                num_sweeps = intensity_sum_index - 1
-
-                # Finding the mean intensity and appending it to the y-axis
-                if num_sweeps > 0:
-                    # Average intensity of all sweeps
-                    mean_intensity = float(
-                        datapoint[intensity_sum_index])/(num_sweeps)
-                elif num_sweeps == 0:
-                    # To account for files with only 1 sweep which have no sum column
-                    mean_intensity = float(datapoint[intensity_sum_index])/(1)
-                else:
-                    print(
-                        "Something has gone wrong with the mean intensity calculation for this file")
-                    continue
-                yaxis.append(mean_intensity)
-                fp_yaxis.append(mean_intensity)
-
-                # Making a list of intensities for a line (excluding the energy and intensity sum values)
-                # print(len(datapoint)) --> test confirmed that the length of a datapoint for a file with only 1 sweep is 3
-                intensities_in_a_line_list = []
-                if len(datapoint) > 3:
-                    # Splitting off the energy and sum columns from the lines
-                    intensities_in_a_line_list = datapoint[1:intensity_sum_index]
-                elif len(datapoint) == 3:
-                    # To account for files with only 1 sweep which have no sum column
-                    intensities_in_a_line_list = datapoint[1:(
-                        intensity_sum_index+1)]
-                else:
-                    print("Something has gone wrong with the len(datapoint)")
-
-                # Calculation of standard deviation of the intensities for each datapoint
-                # Reference: introduction to python pt1 (from the CHEM0062 Moodle page)
-                point_variance = 0
-                for intensity in intensities_in_a_line_list:
-                    point_variance = point_variance + \
-                        ((float(intensity) - mean_intensity)
-                            *(float(intensity) - mean_intensity))
-                point_variance = point_variance/len(intensities_in_a_line_list)
-                point_standard_deviation = np.sqrt(point_variance)
-                standard_deviations_list.append(point_standard_deviation)
-
-                # Printing standard deviations to a separate file
-                # This file prints: (filename, datapoint number, line in the respective file where the datapoint is, standard deviation)
-                # https://howtodoinjava.com/python-examples/python-print-to-file/
-                # 'a+' appends each std to the file line by line (rather than 'w' which overwrites each datapoint std after every line)
-                standard_deviation_file = open("std_file.txt", "a+")
-                print((filename, datapoint_number, line_number,
-                        point_standard_deviation), file=standard_deviation_file)
-                standard_deviation_file.close()
-
-                # Error threshold application based on user choice of threshold type
-                standard_deviation_threshold()
-
-                line = infile.readline()  # Closing the loop
-
-            # Creation of individual scatter plots for each .dat file
-            # Dot markers are used and marker size are set
-            plt.scatter(xaxis, yaxis, marker="o", s=0.5)
-            plt.xlabel("Binding energy / eV")
-            plt.ylabel("Average sweep intensity / a.u.")
-
-            # Saving the figure to the folder where the .dat files are located
-            # This means the user does not need to keep closing pop-up figure windows as with "plt.show()"
-            # Reference: https://stackoverflow.com/questions/17788685/python-saving-multiple-figures-into-one-pdf-file
-            # Removal of .dat filename suffix - figure can only save as a .png file if suffix is removed
-            filename_stripped = filename.replace(".dat", "")
-            if output_plot_choice != "f" and output_plot_choice != "F":
-                plt.savefig("Figure for " + str(filename_stripped))
-                plt.close()
-
-            # Creation of the excluded and included datapoint files
-            # Note: a nested loop was not created for this section as I had trouble with the TextIOWrapper format (see the report)
-            excluded_points_file = open("excluded_datapoints_file.txt", "a+")
-            print(("The following are the data point numbers for the excluded data points (" +
-                    str(filename) + ") : " + str(excluded_point_numbers)), file=excluded_points_file)
-            excluded_points_file.close()
-
-            included_points_file = open("included_datapoints_file.txt", "a+")
-            print(("The following are the data point numbers for the included data points (" +
-                    str(filename) + ") : = " + str(included_point_numbers)), file=included_points_file)
-            included_points_file.close()
-
-# Error threshold application based on user choice of threshold type
-standard_deviation_threshold()
-# Creation of the final combined plot
-# Dot markers and marker size are set
-plt.scatter(fp_xaxis, fp_yaxis, marker="o", s=0.5)
-plt.xlabel("Binding energy / eV")
-plt.ylabel("Average sweep intensity / a.u.")
-plt.savefig("Final combined plot")
-plt.close()
-
-# Removing final combined plot if it was not asked for by the user
-if output_plot_choice == "i" or output_file == "I":
-    os.remove("Final combined plot.png") # Deletes the final plot if only individual plots are wanted.
-elif output_plot_choice == "b" or output_plot_choice == "B":
-    pass
-elif output_plot_choice == "f" or output_plot_choice == "F":
-    pass
-
-# Section divider printed in terminal for clarity 
-print("----------------------------------------------------------------------")
-
-# Final statements to aid the users' understanding of their results and aid future uses of this script.
-print("Try out different standard deviations to see what suits your needs.")
-print("Note that the highest standard deviation in the set was " + str(max(standard_deviations_list)))
-print("Also note that plots of files with only 1 sweep cannot be improved using this program.")
-print("This is because this program requires more than 1 sweep to calculate error values.")
-print("Improve such plots by collecting more experimental data for corresponding files.")
-print("Note: it is recommended you output both plots when experimenting with standard deviation values.")
\ No newline at end of file
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, 'r') as infile:
+        # The first datapoint line is checked for alternative delimiters
+        # Files which already use the standard delimiter are passed straight to the parser without being corrected
+        for x in range(numhead+1):
+            first_line = infile.readline()
+        infile.seek(0)
+        needs_correction = any(alternate in first_line for alternate in alternative_delimiter)
+
+        # The fields of the first datapoint line are found from their positions between the delimiters
+        # Empty fields are kept so that a missing value does not move the other values into the wrong columns
+        # The empty field created by the tab at the end of each line is not counted
+        first_fields = first_line.translate(alternative_delimiter_table).rstrip("\r\n").split(delimit)
+        if not first_fields[-1].strip():
+            first_fields.pop()
+        num_fields = len(first_fields)
+
+        # Every datapoint needs an energy and at least one sweep intensity
+        if len([value for value in first_fields if value.strip()]) < 2:
+            print(
+                "Something has gone wrong with the mean intensity calculation for this file")
+            return None
+
+        # Files whose first datapoint line uses the standard delimiter are first parsed without being corrected
+        # Small files are parsed by NumPy and larger files by pandas
+        file_values = None
+        small_file = os.path.getsize(filepath) <= fast_parse_bytes
+        if not needs_correction:
+            try:
+                file_values = read_datapoint_values(infile, small_file, photon_energy, num_fields)
+            except ValueError:
+                file_values = None
+
+        # Otherwise (or if a later line has an alternative delimiter) the file is parsed again with its delimiters corrected
+        # Small files which NumPy still cannot parse (such as files with missing values) are parsed by pandas
+        if file_values is None:
+            corrected_file = DelimiterCorrectedFile(infile)
+            if small_file:
+                file_values = read_datapoint_values(corrected_file, True, photon_energy, num_fields)
+            if file_values is None:
+                try:
+                    file_values = read_datapoint_values(corrected_file, False, photon_energy, num_fields)
+                except ValueError:
+                    print("The datapoints of " + filename + " could not be read")
+                    return None
+
+    binding_energies, mean_intensities, point_variances = file_values
+    num_datapoints = len(binding_energies)
+
+    # Error threshold application based on user choice of threshold type
+    keep_mask = standard_deviation_threshold(point_variances, std_threshold_squared)
+
+    # Datapoints with missing values have no standard deviation, so they are excluded and the user is told about them
+    num_missing = np.count_nonzero(np.isnan(point_variances))
+    if num_missing:
+        print(filename + " has " + str(num_missing) + " datapoint(s) with missing values, these have been excluded.")
+
+    # Storing the standard deviations of the file as records (filled in place in a preallocated array)
+    # The square roots of the variances are only taken here, for the standard deviation files
+    # The file index is filled in by the main program once the results of all files are collected
+    std_records = np.empty(num_datapoints, dtype=std_record_dtype)
+    std_records["datapoint"] = np.arange(1, num_datapoints + 1)
+    std_records["line"] = std_records["datapoint"] + numhead
+    std_records["std"] = np.sqrt(point_variances)
+
+    # Only the included datapoints are appended to the axes
+    xaxis = binding_energies[keep_mask]
+    yaxis = mean_intensities[keep_mask]
+
+    # Excluded and included datapoint numbers stored in lists (datapoint numbers start at 1)
+    excluded_point_numbers = (np.flatnonzero(~keep_mask) + 1).tolist()
+    included_point_numbers = (np.flatnonzero(keep_mask) + 1).tolist()
+
+    # Creation of individual scatter plots for each .dat file
+    # The axes of the worker process are cleared and reused rather than creating a new figure for every file
+    # Dot markers are used and marker size are set
+    if do_individual:
+        individual_axes.clear()
+        individual_axes.plot(xaxis, yaxis, "o", markersize=marker_size)
+        individual_axes.set_xlabel("Binding energy / eV")
+        individual_axes.set_ylabel("Average sweep intensity / a.u.")
+
+        # Saving the figure to the folder where the .dat files are located
+        # This means the user does not need to keep closing pop-up figure windows as with "plt.show()"
+        # Reference: https://stackoverflow.com/questions/17788685/python-saving-multiple-figures-into-one-pdf-file
+        # Removal of .dat filename suffix - figure can only save as a .png file if suffix is removed
+        filename_stripped = filename.replace(".dat", "")
+        individual_figure.savefig("Figure for " + str(filename_stripped))
+
+    return filename, xaxis, yaxis, std_records, excluded_point_numbers, included_point_numbers
+
+
+# The main program only runs when this script is run directly
+# This stops the worker processes from asking the user for their inputs again when they import this script
+if __name__ == "__main__":
+    # Initial message to the user explaining this program
+    print("You will be prompted to select the folder which contains the .dat files you would like to make plots for.")
+    print("(Note: files in subfolder will not be selected.)")
+    initial_message = input("To continue, press 'y' and then enter ")
+
+    # Creation of folder selection pop-up
+    if initial_message == "y":
+        # If the user continues after the inital message: dialogue box appears, asks user to select folder and returns the path
+        folderpath = askdirectory(title='Select Folder')
+    else:
+        # Message to the user in case they enter the wrong input
+        print("Re-run the code and make sure to just enter the letter 'y' with no spaces or apostrophes - just the letter.")
+        exit()  # Ends the execution of the program so the user will re-run it
+
+    # Statement lets the user check that they imported the right folder
+    print("This is the selected folderpath: " + folderpath)
+
+    # Set up of x-axis and y-axis lists for the final combined plot (of all files in the selected folder)
+    # Each file adds one array of included datapoints to these lists which are joined together once at the end
+    fp_x_chunks = []
+    fp_y_chunks = []
+
+    # Set up of the lists for the binary standard deviation file
+    # Each file adds one record array of its standard deviations and its filename
+    std_record_chunks = []
+    std_filenames = []
+
+    # Section divider printed in terminal for clarity
+    print("----------------------------------------------------------------------")
+
+    # The user inputs the photon energy at which the scan was run
+    print("Photon energy must be an integer or float.")
+    photon_energy = input("Enter photon energy in eV. ")
+
+    # Section divider printed in terminal for clarity
+    print("----------------------------------------------------------------------")
+
+    # The user chooses the threshold standard deviation
+    print("What standard deviation would you like to specify?")
+    std_input = input("Just enter the number without any units. It must be positive. ")
+
+    # Error trap
+    # Creation of an error message if a number is not entered for photon energy or standard deviation value
+    # Creation of an error message if the number entered is negative
+    user_input_numbers = [photon_energy, std_input]
+    for entered_value in user_input_numbers:
+        try:
+            entered_value = float(entered_value) # Ensuring that the input is a number
+            if entered_value >= 0: # Ensuring the number is positive or zero
+                pass
+            else:
+                print("The number you entered for photon energy or standard deviation is negative.")
+                print("Re-run the program and try again.")
+                exit()
+        except ValueError:
+            print ("You did not enter a number for either photon energy or standard deviation.")
+            print("Re-run the program and try again.")
+            exit()
+
+    # The checked inputs are converted to numbers once so they do not need to be converted again for every file
+    photon_energy = float(photon_energy)
+    # The threshold is squared so that it can be compared with the datapoint variances directly
+    std_threshold_squared = float(std_input)**2
+
+
+    # Section divider printed in terminal for clarity
+    print("----------------------------------------------------------------------")
+
+    # The user chooses what kind of output they want
+    print("You can choose the type of output plots produced.")
+    print("If you would like to produce only individual plots for each file, enter 'i'.")
+    print("If you would like to produce only the final combined plot which uses all files in the folder, enter 'f'.")
+    output_plot_choice = input("If you would like to produce both, enter 'b'.")
+    if output_plot_choice == "i" or output_plot_choice == "b" or output_plot_choice == "f":
+        pass
+    elif output_plot_choice == "I" or output_plot_choice == "B" or output_plot_choice == "F":
+        pass
+    else:
+        print("You did not enter an appropriate letter when choosing output plot types.")
+        print("Re-run the program and try again.")
+        exit()  # Ends the execution of the program so the user will re-run it
+    # Individual plots are saved unless only the final combined plot output is chosen
+    do_individual = output_plot_choice != "f" and output_plot_choice != "F"
+
+    # Section divider printed in terminal for clarity
+    print("----------------------------------------------------------------------")
+
+    # Standard deviation, excluded datapoint and included datapoint files which are produced must be reset at the start of every run
+    # This is in case the the user tries to run the program twice without deleting the files produced by the first run
+    # This prevents the program from appending the information from the second run onto that of the first
+    output_file = ["std_file.txt", "std_file.npz", "excluded_datapoints_file.txt",
+                    "included_datapoints_file.txt"]
+    for txt_file in output_file:
+        if os.path.exists(txt_file):  # Existance of the files from previous runs is checked
+            os.remove(txt_file)  # Old files are deleted
+        else:
+            pass
+
+    # Creation of the major loop which gets the filepaths for all the files in the selected folder
+    # glob is used to return files ending with '.dat'
+    # Each file is read and plotted by process_file in a pool of worker processes (one per CPU by default)
+    # The results come back in the same order as the files so the output files are written in that order
+    # Every worker process creates its figure for the individual plots once when it starts
+    # Reference: https://docs.python.org/3/library/multiprocessing.html
+    with Pool(initializer=create_individual_figure) as pool:
+        results = pool.map(partial(process_file, folderpath=folderpath, photon_energy=photon_energy,
+                                   std_threshold_squared=std_threshold_squared, do_individual=do_individual),
+                           glob.glob("*.dat"))
+
+    # The standard deviation, excluded datapoint and included datapoint files are opened once for the whole run
+    # A large buffer means the files are written in a few big pieces rather than line by line
+    standard_deviation_file = open("std_file.txt", "w", buffering=1 << 20)
+    excluded_points_file = open("excluded_datapoints_file.txt", "w", buffering=1 << 20)
+    included_points_file = open("included_datapoints_file.txt", "w", buffering=1 << 20)
+
+    # Running maximum of the standard deviations of all datapoints in all files
+    max_std = -np.inf
+
+    for result in results:
+        # Files which could not be read from the selected folder are skipped
+        if result is None:
+            continue
+        filename, xaxis, yaxis, std_records, excluded_point_numbers, included_point_numbers = result
+
+        # Adding the included datapoints of the file to the final combined plot
+        fp_x_chunks.append(xaxis)
+        fp_y_chunks.append(yaxis)
+
+        # Standard deviations of all datapoints in the file
+        std_filenames.append(filename)
+        std_records["file"] = len(std_filenames) - 1
+        std_record_chunks.append(std_records)
+        point_standard_deviations = std_records["std"]
+        # fmax ignores the nan standard deviations of datapoints with missing values
+        max_std = float(np.fmax.reduce(point_standard_deviations, initial=max_std))
+
+        # Printing standard deviations to a separate file
+        # This file prints: filename, datapoint number, line in the respective file where the datapoint is, standard deviation
+        # All the datapoints of the file are written with one call rather than opening the file for every datapoint
+        # Reference: https://numpy.org/doc/stable/reference/generated/numpy.savetxt.html
+        np.savetxt(standard_deviation_file, std_records[["datapoint", "line", "std"]],
+                   fmt=filename.replace("%", "%%") + "\t%d\t%d\t%.8g")
+
+        # Printing the excluded and included datapoint numbers of the file to their files
+        print(("The following are the data point numbers for the excluded data points (" +
+                str(filename) + ") : " + str(excluded_point_numbers)), file=excluded_points_file)
+        print(("The following are the data point numbers for the included data points (" +
+                str(filename) + ") : = " + str(included_point_numbers)), file=included_points_file)
+
+    # Closing the standard deviation, excluded datapoint and included datapoint files once all the files have been read
+    standard_deviation_file.close()
+    excluded_points_file.close()
+    included_points_file.close()
+
+    # Error trap: if no files could be read, the user did not select the folder this script is saved in
+    # This check is made here as the worker processes cannot report this back to the user themselves
+    if not std_filenames:
+        # Section divider printed in terminal for clarity
+        print("----------------------------------------------------------------------")
+        print("You selected the wrong folder. It must be the folder that this script is saved in.")
+        exit() # Ends the execution of the program so the user will re-run it
+
+    # Joining the included datapoints of all files into the axes of the final combined plot
+    fp_xaxis = np.concatenate(fp_x_chunks)
+    fp_yaxis = np.concatenate(fp_y_chunks)
+
+    # Saving the standard deviations of all files to a binary file which is much faster to load than the text file
+    # It can be loaded with np.load("std_file.npz") and contains the "std" records and the "filenames" they refer to
+    # Reference: https://numpy.org/doc/stable/reference/generated/numpy.savez.html
+    np.savez("std_file.npz", std=np.concatenate(std_record_chunks), filenames=np.array(std_filenames))
+
+    # Creation of the final combined plot in its own figure
+    # Dot markers and marker size are set
+    final_figure, final_axes = plt.subplots()
+    final_axes.plot(fp_xaxis, fp_yaxis, "o", markersize=marker_size)
+    final_axes.set_xlabel("Binding energy / eV")
+    final_axes.set_ylabel("Average sweep intensity / a.u.")
+    final_figure.savefig("Final combined plot")
+    plt.close(final_figure)
+
+    # Removing final combined plot if it was not asked for by the user
+    if output_plot_choice == "i" or output_file == "I":
+        os.remove("Final combined plot.png") # Deletes the final plot if only individual plots are wanted.
+    elif output_plot_choice == "b" or output_plot_choice == "B":
+        pass
+    elif output_plot_choice == "f" or output_plot_choice == "F":
+        pass
+
+    # Section divider printed in terminal for clarity
+    print("----------------------------------------------------------------------")
+
+    # Final statements to aid the users' understanding of their results and aid future uses of this script.
+    print("Try out different standard deviations to see what suits your needs.")
+    print("Note that the highest standard deviation in the set was " + str(max_std))
+    print("Also note that plots of files with only 1 sweep cannot be improved using this program.")
+    print("This is because this program requires more than 1 sweep to calculate error values.")
+    print("Improve such plots by collecting more experimental data for corresponding files.")
+    print("Note: it is recommended you output both plots when experimenting with standard deviation values.")
\ No newline at end of file